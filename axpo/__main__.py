@@ -7,7 +7,10 @@ import os
 import axpo.server
 
 if __name__ == "__main__":
-    port = os.environ.get("PORT", 8080)
+    port = int(os.environ.get("PORT", 8080))
     host = os.environ.get("HOST", "0.0.0.0")
-    uvicorn.run("server:app", host=host, port=port, log_level="info")
+    # uvloop and httptools come with uvicorn[standard], pinning them makes sure we never
+    # silently fall back to the pure python implementations.
+    uvicorn.run("axpo.server:app", host=host, port=port, log_level="info",
+                loop="uvloop", http="httptools", workers=os.cpu_count())
     # You can visit: http://localhost:8080/docs by default.
@@ -1 +1 @@
-from .routes import router
+from .routes import router, close_scrapper
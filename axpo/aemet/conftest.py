@@ -0,0 +1,67 @@
+import os
+# Must be set before the app is built.
+os.environ.setdefault("AXPO_TEST_MODE", "1")
+import axpo.server
+import axpo.aemet.routes as routes
+import axpo.aemet.scrapping as scrapping
+from axpo.aemet.testdata import BASE_URL, API_KEY, TESTCASES
+import fastapi.testclient
+import pytest
+import asyncio
+from typing import *
+
+
+def closing(operator: scrapping.Scrapper) -> Iterator[scrapping.Scrapper]:
+    """
+    Yields the operator, then releases its http client and its database connection.
+    """
+    try:
+        yield operator
+    finally:
+        asyncio.run(operator.aclose())
+
+
+@pytest.fixture(scope="session")
+def client() -> Iterator[fastapi.testclient.TestClient]:
+    """
+    Single client (and app startup) for the whole session.
+    """
+    with fastapi.testclient.TestClient(axpo.server.app) as client:
+        yield client
+
+
+@pytest.fixture
+def operator() -> Iterator[scrapping.Scrapper]:
+    # The scrapper keeps its connection open, an in-memory database lives as long as the test.
+    yield from closing(scrapping.Scrapper(BASE_URL, API_KEY, ":memory:"))
+
+
+def serve(operator: scrapping.Scrapper) -> Iterator[scrapping.Scrapper]:
+    """
+    Serves the operator through the routes, until the generator is resumed.
+    """
+    axpo.server.app.dependency_overrides[routes.scrapper] = lambda: operator
+    yield operator
+    axpo.server.app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def scrapper_override(operator: scrapping.Scrapper) -> Iterator[scrapping.Scrapper]:
+    yield from serve(operator)
+
+
+@pytest.fixture(scope="session")
+def populated_operator() -> Iterator[scrapping.Scrapper]:
+    """
+    Scrapper holding the TESTCASES data, populated once for the whole session.
+    Only for read-only tests, the ones updating the data use the operator fixture.
+    """
+    operator = scrapping.Scrapper(BASE_URL, API_KEY, ":memory:")
+    for x in TESTCASES:
+        operator.insert_into_db(scrapping.Scrapper.parse(x.json_data))
+    yield from closing(operator)
+
+
+@pytest.fixture
+def populated_override(populated_operator: scrapping.Scrapper) -> Iterator[scrapping.Scrapper]:
+    yield from serve(populated_operator)
@@ -1,5 +1,5 @@
 import fastapi
-import fastapi.encoders
+import orjson
 import axpo.aemet.scrapping as scrapping
 import os
 from typing import *
@@ -8,7 +8,9 @@ import datetime
 import http
 import logging
 import enum
-import pytz
+import functools
+import threading
+import zoneinfo
 
 logger = logging.getLogger(__name__)
 
@@ -25,11 +27,32 @@ PREFIX = "/aemet"
 router = fastapi.APIRouter(prefix=PREFIX)
 
 
+_scrapper: Optional[scrapping.Scrapper] = None
+# The dependency runs in the threadpool, concurrent first requests must not build two scrappers.
+_scrapper_lock = threading.Lock()
+
+
 def scrapper() -> scrapping.Scrapper:
     """
     Function used for dependency injection of the scrapper.
+    A single instance is shared so the http connections are kept alive between requests.
+    """
+    global _scrapper
+    with _scrapper_lock:
+        if _scrapper is None:
+            _scrapper = scrapping.Scrapper.default()
+        return _scrapper
+
+
+async def close_scrapper() -> None:
+    """
+    Releases the shared scrapper, if it was ever created.
     """
-    return scrapping.Scrapper.default()
+    global _scrapper
+    with _scrapper_lock:
+        instance, _scrapper = _scrapper, None
+    if instance is not None:
+        await instance.aclose()
 
 
 class Station(enum.StrEnum):
@@ -42,27 +65,57 @@ IDENTITY_MAPPER: Dict[Station, str] = {
     "Meteo Station Juan Carlos I": "89064",
 }
 
+# Every station name shares this dtype, so it survives the concatenation as a categorical.
+_STATION_DTYPE = pd.CategoricalDtype(list(IDENTITY_MAPPER.keys()))
+
 AggregationLevel = Union[Literal["hourly", "daily", "monthly"]]
 
 DATEFORMAT = "%Y-%m-%dT%H:%M"
 
+# The enum values are lowercased, this maps them back to the IANA keys.
+_TIMEZONES: Dict[str, str] = {
+    name.lower(): name for name in zoneinfo.available_timezones()}
 # For proper description in the openapi specification.
-Timezone = enum.StrEnum("Timezones", pytz.all_timezones)
+Timezone = enum.StrEnum("Timezones", sorted(_TIMEZONES.values()))
+
+
+@functools.lru_cache(maxsize=2048)
+def _tz(name: str) -> datetime.tzinfo:
+    """
+    Cached timezone lookup, to avoid resolving the zone on every request.
+    """
+    return zoneinfo.ZoneInfo(_TIMEZONES[name])
+
+
+def _records_json(df: pd.DataFrame) -> bytes:
+    """
+    Serializes a dataframe as a json list of records.
+    Equivalent to orjson.dumps(df.to_dict(orient="records")), without to_dict boxing every cell.
+    """
+    columns = {name: column.tolist() for name, column in df.items()}
+    records = [dict(zip(columns, row)) for row in zip(*columns.values())]
+    # orjson handles datetime natively but not its pandas subclass.
+    return orjson.dumps(records, default=pd.Timestamp.isoformat)
 
 
 @router.get("/udpate-antartica", description="""
             This endpoint is here to update the data periodically. (The company uses airflow, so an http request here makes sense.)
             """)
-def update_antartica(scrapper: Annotated[scrapping.Scrapper, fastapi.Depends(scrapper)],
+async def update_antartica(scrapper: Annotated[scrapping.Scrapper, fastapi.Depends(scrapper)],
                      start_date: str = fastapi.Query(
     description="Start date to fetch data (included, UTC)."),
     end_date: str = fastapi.Query(
         description="End date to fetch data (included, UTC)."),
 ) -> fastapi.Response:
-    scrapper.update_data(start_date, end_date, IDENTITY_MAPPER.values())
+    await scrapper.update_data(
+        datetime.datetime.strptime(start_date, DATEFORMAT).replace(tzinfo=datetime.timezone.utc),
+        datetime.datetime.strptime(end_date, DATEFORMAT).replace(tzinfo=datetime.timezone.utc),
+        IDENTITY_MAPPER.values(),
+    )
     return fastapi.Response(status_code=http.HTTPStatus.OK)
 
 
+# Nothing is awaited here, the sqlite read and the aggregation are blocking: FastAPI runs the sync handler in its threadpool.
 @router.get("/antartica", description="""
             Gets the data for the specified time. Results are in Europe/Madrid timezone.
             """)
@@ -89,41 +142,35 @@ def get_data(
 
 ) -> fastapi.Response:
     all_data: List[pd.DataFrame] = []
-    tz = pytz.timezone(timezone.strip().lower())
+    tz = _tz(timezone.strip().lower())
     start_date = datetime.datetime.strptime(
         start_date, DATEFORMAT).replace(tzinfo=tz)
     end_date = datetime.datetime.strptime(
         end_date, DATEFORMAT).replace(tzinfo=tz)
     mapper: Dict[AggregationLevel, str] = {
         "hourly": "h",
-        "daily": "d",
-        "monthly": "M"
+        "daily": "D",
+        "monthly": "ME"
     }
     for loc in locations:
-        data: List[scrapping.RenamedData] = scrapper.request_data(
+        df = scrapper.request_data(
             start_date,
             end_date,
             IDENTITY_MAPPER[loc],
         )
-        # Not efficient for Raw request but easier to read this exercice.
-        df = pd.DataFrame(data)
-        # Those string fields cannot be aggregated.
-        df.drop(columns={"name", "identifier"}, inplace=True)
-        df["ts"] = pd.to_datetime(df["ts"])
-        if aggregation_level:
-            df = df.resample(mapper[aggregation_level], on="ts").mean()
         # We actually dont need to return the identifier.
-        df["name"] = loc
+        df.drop(columns="identifier", inplace=True)
+        df["name"] = pd.Series(loc, index=df.index, dtype=_STATION_DTYPE)
         all_data.append(df)
     logging.debug("Concatenating dataframes.",
                   extra={"amount_df": len(all_data)})
-    grouped = pd.concat(all_data, axis=0)
+    grouped = pd.concat(all_data, ignore_index=True)
+    if aggregation_level is not None:
+        # All the stations are resampled at once.
+        # sort=False keeps the stations in the requested order.
+        grouped = grouped.groupby(
+            ["name", pd.Grouper(key="ts", freq=mapper[aggregation_level])], sort=False, observed=True,
+        ).mean(numeric_only=True).reset_index()
     # We change the timezone to Europe/Madrid.
-    output_tz = "Europe/Madrid"
-    # Time is the index of the dataset. The input is already timezone aware since we receive the
-    # timezone in the isoformat data from the data source.
-    grouped.index = grouped.index.tz_convert(output_tz)
-    # We must reset index to keep the date column.
-    result = grouped.reset_index().to_dict(orient="records")
-    # Datetime is not json serialzable so we use the fastapi encoder.
-    return fastapi.responses.JSONResponse(content=fastapi.encoders.jsonable_encoder(result))
+    grouped["ts"] = grouped["ts"].dt.tz_convert("Europe/Madrid")
+    return fastapi.Response(content=_records_json(grouped), media_type="application/json")
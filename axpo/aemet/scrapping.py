@@ -8,13 +8,16 @@ from typing import *
 import logging
 import os
 import itertools
-import pytz
+import asyncio
 import sqlite3
+import threading
 import http
 import datetime
 import pathlib
 import string
-import requests
+import httpx
+import orjson
+import pandas as pd
 Url = str
 StationId = str  # Technical identifier of the station. Example: 89070
 
@@ -73,33 +76,72 @@ class RenamedData(TypedDict):
         }
 
 
+# Computed once, the parsing of every payload relies on them.
+_WANTED_FIELDS: Tuple[str, ...] = tuple(Data.__annotations__.keys())
+_RENAME: Dict[str, str] = RenamedData.mapping()
+# Typed even when the query returns no rows.
+_STORED_DTYPES: Dict[str, str] = {
+    "temperature": "float64",
+    "pressure": "float64",
+    "velocity": "float64",
+}
+
+
+def _read_script(name: str) -> str:
+    with open(os.path.join(os.path.dirname(__file__), "scripts", name), 'r') as fi:
+        return fi.read()
+
+
+# Read once at import, every Scrapper runs it on setup.
+# A single transaction, so the bootstrap is committed (and synced) once.
+_STARTUP_SCRIPT: str = "BEGIN;\n{}\nCOMMIT;".format("\n".join(
+    _read_script(command) for command in ("create_measure.sql", "create_station.sql", "insert_stations.sql")
+))
+
+
 class Scrapper():
     """
     Downloads and parses the AEMET data.
     """
     url: Url
-    session: requests.Session
+    session: httpx.AsyncClient
     # AAAA-MM-DDTHH:MM:SSUTC
     # Server side time format (from the data source)
     DATEFORMAT = "%Y-%m-%dT%H:%M:%SUTC"
-    DATEBASE_TIMEZONE = pytz.UTC
+    DATEBASE_TIMEZONE = datetime.timezone.utc
     DATABASE_FORMAT = "%Y-%m-%dT%H:%M:%S"
-    db_path: pathlib.Path
+    db_path: Union[pathlib.Path, str]  # ":memory:" for a private in-memory database.
+    connection: sqlite3.Connection
 
     def __init__(
-        self, base_url: Url, api_key: str, database_path: pathlib.Path
+        self, base_url: Url, api_key: str, database_path: Union[pathlib.Path, str]
     ):
         self.url = base_url.rstrip("/")
-        self.session = requests.Session()
         if not api_key:
             raise EnvironmentError("No api KEY provided")
-        self.session.headers.update(
-            api_key=api_key
+        # Created once so the connections are pooled across requests.
+        # HTTP/2 is negotiated with the servers supporting it (header compression, multiplexing).
+        self.session = httpx.AsyncClient(
+            http2=True,
+            headers={"api_key": api_key},
+            timeout=30,
+            limits=httpx.Limits(max_keepalive_connections=32, keepalive_expiry=60),
         )
-        # Not keeping an open connection as it might have unexpected behavior.
         self.db_path = database_path
+        # A single connection is kept open so sqlite keeps its schema and statement cache warm.
+        # It is shared between threads, hence the lock.
+        self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._lock = threading.Lock()
         self.setup_database()
 
+    async def aclose(self) -> None:
+        """
+        Closes the pooled http connections and the database connection.
+        """
+        await self.session.aclose()
+        with self._lock:
+            self.connection.close()
+
     def setup_database(self) -> None:
         """
         Creates the different tables in the database if they are not present.
@@ -126,33 +168,16 @@ class Scrapper():
         ```
 
         """
-        commands = ["create_measure.sql",
-                    "create_station.sql", "insert_stations.sql"]
-        list_of_statements: List[str] = []
-        for command in commands:
-            with open(os.path.join(os.path.dirname(__file__), "scripts", command), 'r') as fi:
-                list_of_statements.append(fi.read())
-
-        with sqlite3.connect(self.db_path) as connection:
-            for statement in list_of_statements:
-                # No need for a transaction here.
-                logger.debug(
-                    "Setting up database. Step command:\n{}".format(statement))
-                connection.execute(statement)
+        with self._lock:
+            # Readers are not blocked by the writes. This setting is persisted in the database file.
+            # Pragmas must be set outside of the transaction.
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            logger.debug(
+                "Setting up database. Script:\n{}".format(_STARTUP_SCRIPT))
+            self.connection.executescript(_STARTUP_SCRIPT)
         return
 
-    @property
-    def antarctica_url(self) -> string.Template:
-        """Return a string template with the antartica url.
-
-        Returns:
-            string.Template: Fields to set:
-                - start_date
-                - end_date
-                - location
-        """
-        return string.Template(self.url+"/api/antartida/datos/fechaini/${start_date}/fechafin/${end_date}/estacion/${location}")
-
     def fetch_from_database(
         self, start_date: datetime.datetime,
         end_date: datetime.date,
@@ -164,12 +189,9 @@ class Scrapper():
             """
             SELECT count(*) as amount
             """)
-        with sqlite3.connect(self.db_path) as connection:
-            pass
-
         return None
 
-    def _query_single_location(self, start: str, end: str, location: StationId) -> List[RenamedData]:
+    async def _query_single_location(self, start: str, end: str, location: StationId) -> pd.DataFrame:
         """Queries distant source on specific location.
 
         Args:
@@ -178,48 +200,47 @@ class Scrapper():
             location (Station): Location to query onto.
 
         Returns:
-            List[RenamedData]: Formated data.
+            pd.DataFrame: Formated data (see parse).
         """
-        url = self.antarctica_url.safe_substitute(
-            start_date=start, end_date=end, location=location)
-        resp = self.session.get(url)
+        # The identifier ends up in the url path, nothing else than digits is expected.
+        if not (location.isascii() and location.isdigit()):
+            raise ValueError("Invalid station identifier: {}".format(location))
+        url = f"{self.url}/api/antartida/datos/fechaini/{start}/fechafin/{end}/estacion/{location}"
+        resp = await self.session.get(url)
 
-        def log_if_error(resp: requests.Response) -> None:
+        def log_if_error(resp: httpx.Response) -> None:
             if resp.status_code != http.HTTPStatus.OK:
                 logger.error("Error atempting to download the data (1st stage). {}".format({
                     "url": url, "status_code": resp.status_code, "error": resp.content}))
 
         log_if_error(resp)
         resp.raise_for_status()
-        first_response: AntarticaRequestResponse = resp.json()
+        first_response: AntarticaRequestResponse = orjson.loads(resp.content)
         # We must then get the json itself.
-        resp = self.session.get(first_response["datos"])
+        resp = await self.session.get(first_response["datos"])
         log_if_error(resp)
         # The content will actually be a LIST of json objects
-        data: List[Data] = resp.json()
+        data: List[Data] = orjson.loads(resp.content)
+        return self.parse(data)
+
+    @staticmethod
+    def parse(data: List[Data]) -> pd.DataFrame:
+        """Cleans and standardizes the raw data of the source.
+
+        Args:
+            data (List[Data]): Raw entries, as returned by the source.
+
+        Returns:
+            pd.DataFrame: One row per entry, columns being the ones of RenamedData.
+        """
         # We clean the data we dont need
-        wanted_fields = {k for k in Data.__annotations__.keys()}
+        df = pd.DataFrame(data, columns=_WANTED_FIELDS)
         # To standardize the units.
-        convertion_factor = {
-            "pres": 1e2,  # 1hPa = 100 Pa
-        }
-        output: List[RenamedData] = []
-        name_mapper = RenamedData.mapping()
-        for entry in data:
-            new_obj: RenamedData = dict()
-            for k in wanted_fields:
-                renamed_field = name_mapper[k]
-                if k in convertion_factor:
-                    new_obj[renamed_field] = convertion_factor[k] * entry[k]
-                elif k == "fhora":
-                    new_obj[renamed_field] = datetime.datetime.fromisoformat(
-                        entry[k]).astimezone(self.DATEBASE_TIMEZONE)
-                else:
-                    new_obj[renamed_field] = entry[k]
-            output.append(new_obj)
-        return output
-
-    def update_data(
+        df["pres"] *= 1e2  # 1hPa = 100 Pa
+        df["fhora"] = pd.to_datetime(df["fhora"], utc=True, format="ISO8601")
+        return df.rename(columns=_RENAME)
+
+    async def update_data(
         self,
         start_date: datetime.datetime,
         end_date: datetime.datetime,
@@ -229,41 +250,39 @@ class Scrapper():
         This function queries the distant endpoints and updates the database.
         This should regularly be called through a cron.
         """
-        start = start_date.astimezone(pytz.UTC).strftime(self.DATEFORMAT)
-        end = end_date.astimezone(pytz.UTC).strftime(self.DATEFORMAT)
-        for location in locations:
-            chunk = self._query_single_location(start, end, location)
-            self.insert_into_db(chunk)
-
-    def insert_into_db(self, data: List[RenamedData], batch_size: int = 50) -> None:
-        # We do not need a transaction begin in this case.
-        base_query = string.Template(
-            """
+        start = start_date.astimezone(self.DATEBASE_TIMEZONE).strftime(self.DATEFORMAT)
+        end = end_date.astimezone(self.DATEBASE_TIMEZONE).strftime(self.DATEFORMAT)
+        # The distant source latency dominates, so all the locations are fetched concurrently.
+        chunks = await asyncio.gather(*[
+            self._query_single_location(start, end, location) for location in locations
+        ])
+        # The inserts are blocking, they must not hold the event loop.
+        for chunk in chunks:
+            await asyncio.to_thread(self.insert_into_db, chunk)
+
+    def insert_into_db(self, data: pd.DataFrame, batch_size: int = 50) -> None:
+        query = """
         INSERT OR IGNORE INTO Measure(
             identifier, ts, temperature, pressure, velocity
         )
-        VALUES
-            ${values}
-        ;
+        VALUES (?, ?, ?, ?, ?)
         """
-        )
         logger.info("Attempting to insert {} rows by batch of {}".format(
             len(data), batch_size))
-        with sqlite3.connect(self.db_path) as connection:
-            for batch in itertools.batched(data, batch_size):
-                rows: List[str] = []
-                # Note that sqlite does NOT have a real time format. So we store everything in UTC.
-                for val in batch:
-                    row = """("{identifier}", "{ts}", {temperature}, {pressure}, {velocity})""".format(
-                        identifier=val["identifier"],
-                        ts=val["ts"].strftime(self.DATABASE_FORMAT),
-                        temperature=val["temperature"],
-                        pressure=val["pressure"],
-                        velocity=val["velocity"],
-                    )
-                    rows.append(row)
-            query = base_query.safe_substitute(values=",\n".join(rows))
-            connection.execute(query)
+        # Note that sqlite does NOT have a real time format. So we store everything in UTC.
+        records = zip(
+            data["identifier"],
+            data["ts"].dt.strftime(self.DATABASE_FORMAT),
+            data["temperature"],
+            data["pressure"],
+            data["velocity"],
+        )
+        # The context manager commits once, all the batches are written in a single transaction.
+        with self._lock, self.connection as connection:
+            for batch in itertools.batched(records, batch_size):
+                connection.executemany(query, batch)
+            # Refreshes the planner statistics (ANALYZE) when the table changed significantly.
+            connection.execute("PRAGMA optimize")
         return
 
     def request_data(
@@ -271,16 +290,22 @@ class Scrapper():
             start_date: datetime.datetime,
             end_date: datetime.datetime,
             location: StationId
-    ) -> List[RenamedData]:
+    ) -> pd.DataFrame:
+        """Reads the stored measures of a location.
+
+        Returns:
+            pd.DataFrame: Columns of RenamedData except the name, ts being UTC.
+        """
         # We first check if the data is available
 
         logger.info("Data requested. {}".format({
-            "endpoint": self.antarctica_url.template,
+            "source": self.url,
             "start_date": start_date,
             "end_date": end_date,
             "location": location,
         }))
-        base_query = """
+        # The values are bound (no injection possible).
+        query = """
         SELECT
                 identifier,
                 ts,
@@ -290,43 +315,21 @@ class Scrapper():
 
         FROM Measure
         WHERE
-            ts>="{start_date}"
-            AND ts<="{end_date}"
-            AND identifier="{identifier}"
+            ts>=?
+            AND ts<=?
+            AND identifier=?
+        ORDER BY ts
         """
         # TODO: we could add a LIMIT to make sure we dont get ddos.
-        with sqlite3.connect(self.db_path) as connection:
-            query = base_query.format(
-                start_date=start_date.astimezone(
-                    pytz.UTC).strftime(self.DATABASE_FORMAT),
-                end_date=end_date.astimezone(
-                    pytz.UTC).strftime(self.DATABASE_FORMAT),
-                identifier=location,
-            )
-            data = connection.execute(query)
-
-            names_list = connection.execute(
-                "SELECT identifier,name FROM  Station"
-            ).fetchall()
-        names_mapper: Dict[StationId, str] = {
-            x[0]: x[1] for x in names_list
-        }
-        ordered_fields = [
-            "identifier",
-            "ts",
-            "temperature",
-            "pressure",
-            "velocity",
-        ]
-        parsed_data: List[RenamedData] = []
-        for row in data.fetchall():
-            value: RenamedData = {name: row[index]
-                                  for index, name in enumerate(ordered_fields)}
-            value["name"] = names_mapper[row[0]]
-            value["ts"] = datetime.datetime.strptime(
-                value["ts"], self.DATABASE_FORMAT).astimezone(self.DATEBASE_TIMEZONE)
-            parsed_data.append(value)
-        return parsed_data
+        with self._lock:
+            df = pd.read_sql_query(query, self.connection, params=(
+                start_date.astimezone(self.DATEBASE_TIMEZONE).strftime(self.DATABASE_FORMAT),
+                end_date.astimezone(self.DATEBASE_TIMEZONE).strftime(self.DATABASE_FORMAT),
+                location,
+            ), dtype=_STORED_DTYPES)
+        # Stored dates are naive UTC (see DATABASE_FORMAT).
+        df["ts"] = pd.to_datetime(df["ts"], format=self.DATABASE_FORMAT, utc=True)
+        return df
 
     @staticmethod
     def default() -> "Scrapper":
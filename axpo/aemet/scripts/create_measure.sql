@@ -5,6 +5,7 @@ CREATE TABLE
     temperature FLOAT,
     pressure FLOAT,
     velocity FLOAT,
+    -- Also serves as the (identifier, ts) index used by the range scans of request_data.
     PRIMARY KEY (identifier, ts)
     -- TODO: add the foreign key constraint
   );
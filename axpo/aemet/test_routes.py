@@ -1,137 +1,207 @@
-import pytest_httpserver as mock
-import axpo.server
+import pytest_httpx
+import orjson
+import asyncio
+import concurrent.futures
+import time
+import pytest
 import axpo.aemet.routes as routes
 import axpo.aemet.scrapping as scrapping
+from axpo.aemet.testdata import API_KEY, START_DATE, END_DATE, TESTCASES
 import fastapi.testclient
 import pathlib
 import http
 import datetime
-import pytz
 import urllib.parse
+import zoneinfo
 from typing import *
 
 # TODO: We should also make a test for the edge cases such as the none cases etc...
-# TODO: We have to add more test cases for the different aggregation methods.
-# TODO: We have to add more test cases for the different timezones.
 # TODO: We have to add more test cases for update.
 
+# The mocked payloads are serialized once with orjson and served as raw bytes.
+JSON_HEADERS = {"content-type": "application/json"}
 
-def test_get_valid_data(httpserver: mock.HTTPServer, tmp_path: pathlib.Path):
-    class TestCase(NamedTuple):
-        location: str
-        station_name_english: routes.Station
-        json_data: List[scrapping.Data]
-        expected_url_call: str
-    # We use a mock server for tests.
-    api_key = "MOCK_KEY"
-    operator = scrapping.Scrapper(httpserver.url_for(
-        "/"), api_key, tmp_path/"database.sqlite")
-    start_date = datetime.datetime(2024, 1, 1, 0, 0, tzinfo=pytz.UTC)
-    end_date = datetime.datetime(2024, 1, 1, 0, 20, tzinfo=pytz.UTC)
-    testcases: list[TestCase] = [
-        TestCase("89064",
-                 station_name_english="Meteo Station Juan Carlos I",
-                 expected_url_call="/api/antartida/datos/fechaini/2024-01-01T00:00:00UTC/fechafin/2024-01-01T00:20:00UTC/estacion/89064",
-                 json_data=[
-                     {
-                         "identificacion": "89064",
-                         "nombre": "JCI Estacion meteorologica",
-                         "fhora": "2024-01-01T00:00:00+0000",
-                         "pres": 990.8,
-                         "temp": 2.4,
-                         "vel": 1.3,
-                     }, {
-                         "identificacion": "89064",
-                         "nombre": "JCI Estacion meteorologica",
-                         "fhora": "2024-01-01T00:10:00+0000",
-                         "pres": 990.8,
-                         "temp": 2.4,
-                         "vel": 1.1,
-                     }, {
-                         "identificacion": "89064",
-                         "nombre": "JCI Estacion meteorologica",
-                         "fhora": "2024-01-01T00:20:00+0000",
-                         "pres": 990.9,
-                         "temp": 2.4,
-                         "vel": 1.3,
-                     }
-                 ]),
-
-        TestCase("89070", station_name_english="Meteo Station Gabriel de Castilla",
-                 expected_url_call="/api/antartida/datos/fechaini/2024-01-01T00:00:00UTC/fechafin/2024-01-01T00:20:00UTC/estacion/89070",
-                 json_data=[
-                     {
-                         "identificacion": "89070",
-                         "nombre": "GdC Estacion meteorologica",
-                         "fhora": "2024-01-01T00:00:00+0000",
-                         "pres": 991.4,
-                         "temp": 2.7,
-                         "vel": 1.4,
-                     }, {
-                         "identificacion": "89070",
-                         "nombre": "GdC Estacion meteorologica",
-                         "fhora": "2024-01-01T00:10:00+0000",
-                         "pres": 991.5,
-                         "temp": 2.4,
-                         "vel": 1.1,
-                     }, {
-                         "identificacion": "89070",
-                         "nombre": "GdC Estacion meteorologica",
-                         "fhora": "2024-01-01T00:20:00+0000",
-                         "pres": 991.6,
-                         "temp": 2.2,
-                         "vel": 0.8,
-                     }
-                 ]),
-    ]
-    for index, x in enumerate(testcases):
-        actual_json_endpoint = "/{}".format(index)
-        # Serving the json of response
-        httpserver.expect_request(
-            x.expected_url_call,
+
+class ExpectedRecord(NamedTuple):
+    ts: str
+    name: str
+    temperature: float
+    pressure: float
+    velocity: float
+
+
+JCI = "Meteo Station Juan Carlos I"
+GDC = "Meteo Station Gabriel de Castilla"
+# Both stations have 3 measures, 10 minutes apart: they all fall in the same hour, day and month.
+AGGREGATED = [
+    ExpectedRecord("2024-01-01T01:00:00+01:00", JCI, 2.4, 99083.333, 1.233),
+    ExpectedRecord("2024-01-01T01:00:00+01:00", GDC, 2.433, 99150, 1.099),
+]
+
+
+LOCATION_NAMES = tuple(x.station_name_english for x in TESTCASES)
+# Query of the whole TESTCASES period, in UTC.
+QUERY_STRING = urllib.parse.urlencode(
+    {
+        "start_date": START_DATE.strftime(routes.DATEFORMAT),
+        "end_date": END_DATE.strftime(routes.DATEFORMAT),
+        "locations": LOCATION_NAMES,
+    }, True,
+)
+
+
+@pytest.mark.parametrize("aggregation_level,expected", [
+    ("hourly", AGGREGATED),
+    ("daily", AGGREGATED),
+    # Monthly bins are labelled with the end of the month.
+    ("monthly", [x._replace(ts="2024-01-31T01:00:00+01:00") for x in AGGREGATED]),
+    # Without aggregation, the raw records are returned.
+    (None, [
+        ExpectedRecord("2024-01-01T01:00:00+01:00", JCI, 2.4, 99080, 1.3),
+        ExpectedRecord("2024-01-01T01:10:00+01:00", JCI, 2.4, 99080, 1.1),
+        ExpectedRecord("2024-01-01T01:20:00+01:00", JCI, 2.4, 99090, 1.3),
+        ExpectedRecord("2024-01-01T01:00:00+01:00", GDC, 2.7, 99140, 1.4),
+        ExpectedRecord("2024-01-01T01:10:00+01:00", GDC, 2.4, 99150, 1.1),
+        ExpectedRecord("2024-01-01T01:20:00+01:00", GDC, 2.2, 99160, 0.8),
+    ]),
+])
+def test_get_valid_data(populated_override: scrapping.Scrapper, client: fastapi.testclient.TestClient,
+                        aggregation_level: Optional[routes.AggregationLevel], expected: List[ExpectedRecord]):
+    endpoint = "{}/antartica?{}".format(routes.PREFIX, QUERY_STRING)
+    if aggregation_level:
+        endpoint += "&" + urllib.parse.urlencode({"aggregation_level": aggregation_level})
+
+    result = client.get(endpoint)
+    assert result.status_code == http.HTTPStatus.OK, "Invalid status code when querying {}. Error : {}".format(
+        endpoint, result.content)
+    # We do not compare the data directly as we want more readable error messages.
+    j: List[scrapping.RenamedData] = orjson.loads(result.content)
+    assert len(j) == len(expected)
+    EPSILON = 1e-1
+    for index, (actual, wanted) in enumerate(zip(j, expected)):
+        assert actual["ts"] == wanted.ts, "Record {}".format(index)
+        assert abs(actual["temperature"] - wanted.temperature) < EPSILON, "Record {}".format(index)
+        assert abs(actual["pressure"] - wanted.pressure) < EPSILON, "Record {}".format(index)
+        assert abs(actual["velocity"] - wanted.velocity) < EPSILON, "Record {}".format(index)
+        assert actual["name"] == wanted.name, "Record {}".format(index)
+        # We actually dont need to return the identifier.
+        assert "identifier" not in actual, "Record {}".format(index)
+
+
+@pytest.mark.parametrize("timezone", ["UTC", "Europe/Madrid", "America/Punta_Arenas"])
+def test_get_data_timezone(populated_override: scrapping.Scrapper, client: fastapi.testclient.TestClient,
+                           timezone: str):
+    # The same period, expressed in the given timezone.
+    tz = zoneinfo.ZoneInfo(timezone)
+    endpoint = "{}/antartica?{}".format(routes.PREFIX, urllib.parse.urlencode(
+        {
+            "start_date": START_DATE.astimezone(tz).strftime(routes.DATEFORMAT),
+            "end_date": END_DATE.astimezone(tz).strftime(routes.DATEFORMAT),
+            "timezone": routes.Timezone[timezone].value,
+            "locations": LOCATION_NAMES,
+        }, True,
+    ))
+    result = client.get(endpoint)
+    assert result.status_code == http.HTTPStatus.OK, "Invalid status code when querying {}. Error : {}".format(
+        endpoint, result.content)
+    j: List[scrapping.RenamedData] = orjson.loads(result.content)
+    assert len(j) == 6
+    # Output is always in Europe/Madrid.
+    assert j[0]["ts"] == "2024-01-01T01:00:00+01:00"
+    assert j[-1]["ts"] == "2024-01-01T01:20:00+01:00"
+
+
+class MockedSource(NamedTuple):
+    """
+    Pre-serialized answers of the distant source for one station.
+    """
+    path: str  # Relative to the base url of the api.
+    datos_url: str
+    envelope: bytes
+    data: bytes
+
+
+def mocked_source(location: str) -> MockedSource:
+    # As with the real source, the data is served from another host.
+    datos_url = "http://datos.aemet.mock/{}".format(location)
+    return MockedSource(
+        "/api/antartida/datos/fechaini/2024-01-01T00:00:00UTC/fechafin/2024-01-01T00:20:00UTC/estacion/{}".format(
+            location),
+        datos_url,
+        orjson.dumps(scrapping.AntarticaRequestResponse(datos=datos_url)),
+        orjson.dumps([{
+            "identificacion": location,
+            "nombre": "Estacion meteorologica",
+            "fhora": "2024-01-01T00:10:00+0000",
+            "pres": 990.8,
+            "temp": 2.4,
+            "vel": 1.1,
+        }]),
+    )
+
+
+# Serialized once, the test only registers them.
+UPDATE_SOURCES: List[MockedSource] = [mocked_source(location) for location in routes.IDENTITY_MAPPER.values()]
+
+
+def test_update_data(httpx_mock: pytest_httpx.HTTPXMock, scrapper_override: scrapping.Scrapper,
+                     client: fastapi.testclient.TestClient):
+    operator = scrapper_override
+    # Resolved once, every registered answer shares them.
+    base_url = operator.url
+    expected_headers = {"api_key": operator.session.headers["api_key"]}
+    for source in UPDATE_SOURCES:
+        httpx_mock.add_response(
+            url=base_url + source.path,
             method="GET",
-        ).respond_with_json(
-            scrapping.AntarticaRequestResponse(
-                datos=httpserver.url_for(actual_json_endpoint)
-            )
+            match_headers=expected_headers,
+            content=source.envelope,
+            headers=JSON_HEADERS,
         )
-        # We should add the headers but that library seems to require it fully provided, and not partially with the api key.
-        httpserver.expect_request(
-            actual_json_endpoint,
+        httpx_mock.add_response(
+            url=source.datos_url,
             method="GET",
-        ).respond_with_json(
-            x.json_data
+            content=source.data,
+            headers=JSON_HEADERS,
         )
-    operator.update_data(start_date, end_date, ["89064", "89070" ])
-
-    axpo.server.app.dependency_overrides[routes.scrapper] = lambda: operator
-    with fastapi.testclient.TestClient(axpo.server.app) as client:
-
-        endpoint = "{}/antartica?{}".format(routes.PREFIX, urllib.parse.urlencode(
-            {
-                "start_date": start_date.strftime(routes.DATEFORMAT),
-                "end_date": end_date.strftime(routes.DATEFORMAT),
-                "locations": [x.station_name_english for x in testcases],
-                "aggregation_level": "hourly",
-            }, True,
-        ))
-
-        result = client.get(endpoint)
-        assert result.status_code == http.HTTPStatus.OK, "Invalid status code when querying {}. Error : {}".format(
-            endpoint, result.content)
-        # We do not compare the data directly as we want more readable error messages.
-        j: List[scrapping.RenamedData] = result.json()
-        case_0 = j[0]
-        case_1 = j[1]
-        EPSILON = 1e-1
-        assert case_0["ts"] == "2024-01-01T01:00:00+01:00"
-        assert abs(case_0["temperature"] - 2.4) < EPSILON
-        assert abs(case_0["pressure"] - 99083.333) < EPSILON
-        assert abs(case_0["velocity"] - 1.233) < EPSILON
-        assert case_0["name"] == "Meteo Station Juan Carlos I"
-
-        assert case_1["ts"] == "2024-01-01T01:00:00+01:00"
-        assert abs(case_1["temperature"] - 2.433) < EPSILON
-        assert abs(case_1["pressure"] - 99150) < EPSILON
-        assert abs(case_1["velocity"] - 1.099) < EPSILON
-        assert case_1["name"] == "Meteo Station Gabriel de Castilla"
+
+    endpoint = "{}/udpate-antartica?{}".format(routes.PREFIX, urllib.parse.urlencode(
+        {
+            "start_date": "2024-01-01T00:00",
+            "end_date": "2024-01-01T00:20",
+        },
+    ))
+    result = client.get(endpoint)
+    assert result.status_code == http.HTTPStatus.OK, "Invalid status code when querying {}. Error : {}".format(
+        endpoint, result.content)
+    for location in routes.IDENTITY_MAPPER.values():
+        data = operator.request_data(START_DATE, END_DATE, location)
+        assert len(data) == 1
+        assert data["ts"].iloc[0] == datetime.datetime(2024, 1, 1, 0, 10, tzinfo=datetime.timezone.utc)
+
+
+def test_scrapper_is_shared(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path):
+    monkeypatch.setenv("API_KEY", API_KEY)
+    monkeypatch.setenv("DATABASE_PATH", str(tmp_path/"database.sqlite"))
+    try:
+        # Building a scrapper touches the disk, it must not be done per request.
+        assert routes.scrapper() is routes.scrapper()
+    finally:
+        asyncio.run(routes.close_scrapper())
+    assert routes._scrapper is None
+
+
+def test_scrapper_is_built_once(monkeypatch: pytest.MonkeyPatch):
+    built: List[object] = []
+
+    def slow_default() -> object:
+        # Leaves time for the other threads to race on the first call.
+        time.sleep(0.05)
+        built.append(object())
+        return built[-1]
+    monkeypatch.setattr(scrapping.Scrapper, "default", slow_default)
+    monkeypatch.setattr(routes, "_scrapper", None)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        instances = list(executor.map(lambda _: routes.scrapper(), range(8)))
+    assert len(built) == 1
+    assert all(x is built[0] for x in instances)
@@ -0,0 +1,25 @@
+import axpo.aemet.scrapping as scrapping
+import asyncio
+import pytest
+import pandas as pd
+
+
+def test_insert_all_batches(operator: scrapping.Scrapper):
+    amount = 120
+    data = pd.DataFrame({
+        "identifier": "89064",
+        "ts": pd.date_range("2024-01-01", periods=amount, freq="10min", tz="UTC"),
+        "temperature": 2.4,
+        "pressure": 99080.0,
+        "velocity": 1.3,
+    })
+    # More rows than the batch size, every batch must be inserted.
+    operator.insert_into_db(data, batch_size=50)
+    (count,) = operator.connection.execute("SELECT count(*) FROM Measure").fetchone()
+    assert count == amount
+
+
+def test_reject_invalid_location(operator: scrapping.Scrapper):
+    with pytest.raises(ValueError):
+        asyncio.run(operator._query_single_location(
+            "2024-01-01T00:00:00UTC", "2024-01-01T00:20:00UTC", "89064/../89070"))
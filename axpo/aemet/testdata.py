@@ -0,0 +1,77 @@
+"""
+Data shared by the tests and their fixtures (conftest.py is not meant to be imported).
+"""
+import axpo.aemet.routes as routes
+import axpo.aemet.scrapping as scrapping
+import datetime
+from typing import *
+
+# The distant source is mocked in-process, at the httpx transport level.
+BASE_URL = "http://aemet.mock"
+API_KEY = "MOCK_KEY"
+
+
+class TestCase(NamedTuple):
+    __test__ = False  # Not a test class.
+    location: str
+    station_name_english: routes.Station
+    json_data: List[scrapping.Data]
+
+
+# Seed data of the read-only tests.
+START_DATE = datetime.datetime(2024, 1, 1, 0, 0, tzinfo=datetime.timezone.utc)
+END_DATE = datetime.datetime(2024, 1, 1, 0, 20, tzinfo=datetime.timezone.utc)
+TESTCASES: List[TestCase] = [
+    TestCase("89064",
+             station_name_english="Meteo Station Juan Carlos I",
+             json_data=[
+                 {
+                     "identificacion": "89064",
+                     "nombre": "JCI Estacion meteorologica",
+                     "fhora": "2024-01-01T00:00:00+0000",
+                     "pres": 990.8,
+                     "temp": 2.4,
+                     "vel": 1.3,
+                 }, {
+                     "identificacion": "89064",
+                     "nombre": "JCI Estacion meteorologica",
+                     "fhora": "2024-01-01T00:10:00+0000",
+                     "pres": 990.8,
+                     "temp": 2.4,
+                     "vel": 1.1,
+                 }, {
+                     "identificacion": "89064",
+                     "nombre": "JCI Estacion meteorologica",
+                     "fhora": "2024-01-01T00:20:00+0000",
+                     "pres": 990.9,
+                     "temp": 2.4,
+                     "vel": 1.3,
+                 }
+             ]),
+
+    TestCase("89070", station_name_english="Meteo Station Gabriel de Castilla",
+             json_data=[
+                 {
+                     "identificacion": "89070",
+                     "nombre": "GdC Estacion meteorologica",
+                     "fhora": "2024-01-01T00:00:00+0000",
+                     "pres": 991.4,
+                     "temp": 2.7,
+                     "vel": 1.4,
+                 }, {
+                     "identificacion": "89070",
+                     "nombre": "GdC Estacion meteorologica",
+                     "fhora": "2024-01-01T00:10:00+0000",
+                     "pres": 991.5,
+                     "temp": 2.4,
+                     "vel": 1.1,
+                 }, {
+                     "identificacion": "89070",
+                     "nombre": "GdC Estacion meteorologica",
+                     "fhora": "2024-01-01T00:20:00+0000",
+                     "pres": 991.6,
+                     "temp": 2.2,
+                     "vel": 0.8,
+                 }
+             ]),
+]
@@ -3,12 +3,27 @@ This module will contain the required endpoints.
 Note that if the project was bigger, we would be using a router, and dispatching the routes in different files.
 """
 import fastapi
+import fastapi.middleware.gzip
 import http
 from typing import *
 import pydantic
 import os
 import datetime
+import contextlib
 import axpo.aemet
 
-app = fastapi.FastAPI()
+
+@contextlib.asynccontextmanager
+async def lifespan(app: fastapi.FastAPI) -> AsyncIterator[None]:
+    yield
+    # The http client of the scrapper is shared between requests, it is closed on shutdown.
+    await axpo.aemet.close_scrapper()
+
+# The openapi schema and the docs are not served in test mode (see conftest.py).
+docs: Dict[str, Any] = {}
+if os.environ.get("AXPO_TEST_MODE") == "1":
+    docs = {"openapi_url": None, "docs_url": None, "redoc_url": None}
+app = fastapi.FastAPI(lifespan=lifespan, **docs)
+# The measures are sent as json records, with repeated keys: they compress well.
+app.add_middleware(fastapi.middleware.gzip.GZipMiddleware, minimum_size=1024, compresslevel=5)
 app.include_router(axpo.aemet.router)